@@ -1,18 +1,19 @@
 import logging
 import os
 import random
+from concurrent.futures import ThreadPoolExecutor
 from threading import Thread, Lock
-import inotify.adapters
-import inotify.constants
 from PIL import Image
 from typing import Dict, Union
 
 from .constants import Constants
 from .decorators import wait_lock
 from .threading_utils import ThreadingUtils
-from .classes import ImageMetadata
+from .classes import ImageMetadata, ResolvedVariant, VariantRequest
 from .filename_utils import FilenameUtils
 from .image_utils import ImageUtils
+from .profiling import ProfilingUtils
+from .storage import LocalStorage, Storage, StorageEvent
 from .utils import Utils
 
 from datetime import timedelta
@@ -20,23 +21,43 @@ from time import perf_counter
 
 
 class Cache:
-    _ids_to_metadata: Dict[str, ImageMetadata] = {}
-    _image_dir: str
-    _cache_dir: str
+    _ids_to_metadata: Dict[str, ImageMetadata]
+    _source_storage: Storage
+    _cache_storage: Storage
     _logger: logging.Logger
     
     _inotify_thread: Thread
-    _original_filenames_to_ids: Dict[str, str] = {}
+    _executor: ThreadPoolExecutor
+    _original_filenames_to_ids: Dict[str, str]
+    _existing_variants: set[str]
     _mutex_lock: Lock = Lock()
 
-    def __init__(self, *, image_dir: str, cache_dir: str, enable_inotify: bool = True):
-        image_dir = os.path.abspath(image_dir)
-        cache_dir = os.path.abspath(cache_dir)
+    def __init__(
+        self,
+        *,
+        image_dir: Union[str, None] = None,
+        cache_dir: Union[str, None] = None,
+        source_storage: Union[Storage, None] = None,
+        cache_storage: Union[Storage, None] = None,
+        enable_inotify: bool = True,
+        max_generation_workers: Union[int, None] = None,
+    ):
+        if not source_storage and not image_dir:
+            raise ValueError("Either image_dir or source_storage has to be set")
+        if not cache_storage and not cache_dir:
+            raise ValueError("Either cache_dir or cache_storage has to be set")
+        
+        source_storage = source_storage or LocalStorage(image_dir)
+        cache_storage = cache_storage or LocalStorage(cache_dir)
         
         self._logger = logging.getLogger(__name__)
-        self._logger.info(f"Created cache instance with image directory='{image_dir}' and cache directory='{cache_dir}'")
-        self._cache_dir = cache_dir
-        self._image_dir = image_dir
+        self._logger.info(f"Created cache instance with source storage={source_storage} and cache storage={cache_storage}")
+        self._source_storage = source_storage
+        self._cache_storage = cache_storage
+        self._executor = ThreadPoolExecutor(max_workers=max_generation_workers, thread_name_prefix="variant-generation")
+        self._ids_to_metadata = {}
+        self._original_filenames_to_ids = {}
+        self._existing_variants = set()
         
         self._generate_cache()
         
@@ -44,34 +65,36 @@ class Cache:
 
     def _generate_cache(self) -> Dict[str, ImageMetadata]:
         start = perf_counter()
-        image_dir = self._image_dir
         
         filename_to_image: dict[str, Image.Image] = {}
 
-        for filename in os.listdir(image_dir):
+        for filename in self._source_storage.list_names():
             if not os.path.splitext(filename.lower())[1] in Constants.ALLOWED_INPUT_FILE_EXTENSIONS:
                 self._logger.warning(f"Ignoring file '{filename}' because it doesn't have an allowed file extension")
                 continue
             
             try:
-                img = Image.open(os.path.join(image_dir, filename))
+                img = self._source_storage.read_image(filename)
                 img.load()
                 filename_to_image[filename] = img
             except OSError as e:
-                self._logger.exception(f"Failed loading file '{os.path.join(image_dir, filename)}'")
+                self._logger.exception(f"Failed loading file '{filename}'")
                 continue
 
         for filename, image in filename_to_image.items():
             try:
-                id, metadata = ImageUtils.convert_to_unified_format_and_write_to_filesystem(
-                    output_path=self._cache_dir, image=image
+                id, metadata = ImageUtils.convert_to_unified_format_and_write_to_storage(
+                    storage=self._cache_storage, image=image
                 )
                 self._ids_to_metadata[id] = metadata
                 self._original_filenames_to_ids[filename] = id
                 image.close()
             except OSError:
-                self._logger.exception(f"Failed writing converted file '{'no filename' if not image.filename else image.filename}'")
+                self._logger.exception(f"Failed writing converted file '{filename}'")
                 continue
+        
+        # a single listing of the cache storage, afterwards variant lookups don't need to touch the storage
+        self._existing_variants.update(self._cache_storage.list_names())
 
         end = perf_counter()
         self._logger.info(f"Generated {len(self._ids_to_metadata.keys())} cached images in {timedelta(seconds=end-start)}")
@@ -84,18 +107,12 @@ class Cache:
     
     def _watch_fs_events(self):
         logger = logging.getLogger(f"{__name__}.inotify-thread")
-        try:            
-            i = inotify.adapters.Inotify()
-
-            i.add_watch(self._image_dir, mask=inotify.constants.IN_DELETE | inotify.constants.IN_CLOSE_WRITE)
-            logger.info(f"Added watch for folder '{self._image_dir}'")
-
-            for event in i.event_gen(yield_nones=False):
-                (event_obj, _, _, filename) = event
-                logger.debug(event)                
-                mask = event_obj.mask
+        try:
+            for event in self._source_storage.watch():
+                logger.debug(event)
+                filename = event.name
                                 
-                if (mask & inotify.constants.IN_CLOSE_WRITE) == inotify.constants.IN_CLOSE_WRITE:
+                if event.type == StorageEvent.CREATED:
                     logger.info(f"Detected new file '{filename}', adjusting cache")
                     
                     if not os.path.splitext(filename.lower())[1] in Constants.ALLOWED_INPUT_FILE_EXTENSIONS:
@@ -104,18 +121,19 @@ class Cache:
                     
                     image: Image.Image = None
                     try:
-                        image = Image.open(os.path.join(self._image_dir, filename))
+                        image = self._source_storage.read_image(filename)
                     except OSError as e:
                         logger.exception("Exception while opening file")
                         continue
                     
                     ThreadingUtils.wait_and_acquire_lock(self._mutex_lock)
                     try:
-                        id, metadata = ImageUtils.convert_to_unified_format_and_write_to_filesystem(
-                            output_path=self._cache_dir, image=image
+                        id, metadata = ImageUtils.convert_to_unified_format_and_write_to_storage(
+                            storage=self._cache_storage, image=image
                         )
                         self._ids_to_metadata[id] = metadata
                         self._original_filenames_to_ids[filename] = id
+                        self._existing_variants.add(metadata.get_filename(id, None, None))
                     except OSError as e:
                         logger.exception("Exception while converting file")
                         continue
@@ -123,7 +141,7 @@ class Cache:
                         self._mutex_lock.release()
                         if image: image.close()
 
-                elif (mask & inotify.constants.IN_DELETE) == inotify.constants.IN_DELETE:
+                elif event.type == StorageEvent.DELETED:
                     logger.info(f"Detected deleted file '{filename}', adjusting cache")
                     ThreadingUtils.wait_and_acquire_lock(self._mutex_lock)
                     id = self._original_filenames_to_ids.get(filename)
@@ -144,6 +162,123 @@ class Cache:
         metadata = self._ids_to_metadata.get(id)
         self._mutex_lock.release()
 
+        with ProfilingUtils.span(ProfilingUtils.VARIANT_RESOLUTION):
+            _, _, expected_filename = self._resolve_variant(id, metadata, width=width, height=height, crop=crop)
+            
+            if not generate_variant_if_missing or self._variant_exists(expected_filename):
+                return expected_filename
+
+        with ProfilingUtils.span(ProfilingUtils.GENERATION):
+            return self._generate_variant(id, metadata, width=width, height=height, crop=crop)
+    
+    def get_variant_file(
+        self, id: str, width: Union[int, None] = None, height: Union[int, None] = None, crop: bool = False,
+    ) -> tuple[str, Union[os.stat_result, None]]:
+        """
+        Resolves a variant for serving it. Variants that have been removed from the cache storage
+        since they've been indexed are generated again.
+
+        Returns:
+            tuple[str, Union[os.stat_result, None]]: the filename and, for storages on the local filesystem, the file's stat result
+        """
+        filename = self.get_filename(id, width=width, height=height, crop=crop)
+        
+        try:
+            return filename, self._stat_variant(filename)
+        except FileNotFoundError:
+            self._logger.warning(f"Cached variant '{filename}' has vanished, generating it again")
+            self._existing_variants.discard(filename)
+        
+        metadata = self.get_metadata(id)
+        with ProfilingUtils.span(ProfilingUtils.GENERATION):
+            filename = self._generate_variant(id, metadata, width=width, height=height, crop=crop)
+        
+        return filename, self._stat_variant(filename)
+    
+    def _stat_variant(self, filename: str) -> Union[os.stat_result, None]:
+        path = self._cache_storage.get_local_path(filename)
+        if path:
+            return os.stat(path)
+        
+        if not self._cache_storage.exists(filename):
+            raise FileNotFoundError(f"No such variant in cache storage: '{filename}'")
+        
+        return None
+    
+    def get_variants(self, requests: list[VariantRequest]) -> list[ResolvedVariant]:
+        """
+        Resolves multiple variants against a single snapshot of the cache and generates
+        all missing variants in parallel.
+
+        Args:
+            requests (list[VariantRequest]): the variants to resolve
+
+        Returns:
+            list[ResolvedVariant]: the resolved variants in the order they were requested, with the error set for variants that couldn't be resolved
+        """
+        with ProfilingUtils.span(ProfilingUtils.LOOKUP):
+            snapshot = self.get_metadata_snapshot([request.id for request in requests])
+        
+        resolved: list[ResolvedVariant] = []
+        unknown: dict[str, VariantRequest] = {}
+        
+        with ProfilingUtils.span(ProfilingUtils.VARIANT_RESOLUTION):
+            for request in requests:
+                metadata = snapshot.get(request.id)
+                if not metadata:
+                    resolved.append(ResolvedVariant(id=request.id, error=f"Image with id='{request.id}' could not be found!"))
+                    continue
+                
+                try:
+                    requested_width, requested_height = ImageUtils.get_requested_dimensions(
+                        original_width=metadata.original_width,
+                        original_height=metadata.original_height,
+                        width=request.width,
+                        height=request.height,
+                        is_thumbnail=request.thumb,
+                    )
+                except ValueError as e:
+                    resolved.append(ResolvedVariant(id=request.id, error=str(e)))
+                    continue
+                
+                request = VariantRequest(id=request.id, width=requested_width, height=requested_height, thumb=request.thumb)
+                width, height, filename = self._resolve_variant(request.id, metadata, width=request.width, height=request.height, crop=request.thumb)
+                resolved.append(ResolvedVariant(id=request.id, width=width, height=height, filename=filename, metadata=metadata))
+                
+                if filename not in self._existing_variants:
+                    unknown[filename] = request
+            
+            # check all variants that haven't been seen yet with a single batched lookup
+            existing = self._cache_storage.exists_many(list(unknown.keys())) if unknown else set()
+            self._existing_variants.update(existing)
+            missing = {filename: request for filename, request in unknown.items() if filename not in existing}
+        
+        if missing:
+            start = perf_counter()
+            failed: dict[str, str] = {}
+            with ProfilingUtils.span(ProfilingUtils.GENERATION):
+                futures = {
+                    filename: self._executor.submit(self._generate_variant, request.id, snapshot[request.id], width=request.width, height=request.height, crop=request.thumb)
+                    for filename, request in missing.items()
+                }
+                for filename, future in futures.items():
+                    try:
+                        future.result()
+                    except Exception:
+                        self._logger.exception(f"Failed generating variant '{filename}'")
+                        failed[filename] = f"Failed generating variant for image with id='{missing[filename].id}'!"
+            end = perf_counter()
+            self._logger.debug(f"Generated {len(futures)} missing variants in {timedelta(seconds=end-start)}")
+            
+            for variant in resolved:
+                if variant.filename in failed:
+                    variant.error = failed[variant.filename]
+
+        return resolved
+    
+    def _resolve_variant(
+        self, id: str, metadata: ImageMetadata, width: Union[int, None] = None, height: Union[int, None] = None, crop: bool = False,
+    ) -> tuple[int, int, str]:
         width, height = Utils.clamp(width, 0, metadata.original_width), Utils.clamp(
             height, 0, metadata.original_height
         )
@@ -156,36 +291,49 @@ class Cache:
                 height=height,
             )
 
-        expected_filename = os.path.join(
-            self._cache_dir,
-            FilenameUtils.get_filename(
-                id=id, width=width, height=height, format=metadata.format
-            ),
+        expected_filename = FilenameUtils.get_filename(
+            id=id, width=width, height=height, format=metadata.format
         )
         
-        if os.path.isfile(expected_filename) or not generate_variant_if_missing:
-            return expected_filename
-
-        source_filename = os.path.join(
-            self._cache_dir,
-            FilenameUtils.get_filename(
-                id=id,
-                width=metadata.original_width,
-                height=metadata.original_height,
-                format=metadata.format,
-            ),
-        )
-        filename = ImageUtils.write_scaled_copy_from_source_filename_to_filesystem(
+        return width, height, expected_filename
+    
+    def _generate_variant(
+        self, id: str, metadata: ImageMetadata, width: Union[int, None] = None, height: Union[int, None] = None, crop: bool = False,
+    ) -> str:
+        width, height, _ = self._resolve_variant(id, metadata, width=width, height=height, crop=crop)
+        
+        source_filename = metadata.get_filename(id, None, None)
+        filename = ImageUtils.write_scaled_copy_from_source_name_to_storage(
             id=id,
-            source_filename=source_filename,
-            output_path=self._cache_dir,
+            source_name=source_filename,
+            storage=self._cache_storage,
             width=width,
             height=height,
             crop=crop,
         )
+        self._existing_variants.add(filename)
         
         return filename
     
+    def _variant_exists(self, filename: str) -> bool:
+        if filename in self._existing_variants:
+            return True
+        
+        if self._cache_storage.exists(filename):
+            self._existing_variants.add(filename)
+            return True
+        
+        return False
+    
+    def get_local_path(self, filename: str) -> Union[str, None]:
+        return self._cache_storage.get_local_path(filename)
+    
+    def read_bytes(self, filename: str) -> bytes:
+        return self._cache_storage.read_bytes(filename)
+    
+    def read_image(self, filename: str) -> Image.Image:
+        return self._cache_storage.read_image(filename)
+    
     @wait_lock(_mutex_lock)
     def get_random_id(self) -> str:
         return random.choice(list(self._ids_to_metadata.keys()))
@@ -198,6 +346,10 @@ class Cache:
     def get_metadata(self, id: str) -> Union[ImageMetadata, None]:
         return self._ids_to_metadata.get(id)
     
+    @wait_lock(_mutex_lock)
+    def get_metadata_snapshot(self, ids: list[str]) -> dict[str, ImageMetadata]:
+        return {id: self._ids_to_metadata[id] for id in ids if id in self._ids_to_metadata}
+    
     @wait_lock(_mutex_lock)
     def id_exists(self, id: str) -> bool:
         return id in self._ids_to_metadata.keys()
@@ -45,5 +45,21 @@ class ResolutionVariant:
     current: bool
     filename: str
 
+@dataclass
+class VariantRequest:
+    id: str
+    width: Union[int, None] = None
+    height: Union[int, None] = None
+    thumb: bool = False
+
+@dataclass
+class ResolvedVariant:
+    id: str
+    width: Union[int, None] = None
+    height: Union[int, None] = None
+    filename: Union[str, None] = None
+    metadata: Union[ImageMetadata, None] = None
+    error: Union[str, None] = None
+
 class FaviconResponse(Response):
     media_type = "image/svg+xml"
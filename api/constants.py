@@ -2,6 +2,21 @@ class Constants:
     ALLOWED_DIMENSIONS = [2048, 1024, 512, 256, 128, 64, 32, 16]
     DEFAULT_FORMAT = "png"
     ALLOWED_INPUT_FILE_EXTENSIONS = [".jpg", ".jpeg", ".png"]
+    MAX_BATCH_SIZE = 100
+    DEFAULT_CRAWLER_USER_AGENTS = [
+        "facebookexternalhit",
+        "facebookcatalog",
+        "twitterbot",
+        "slackbot",
+        "discordbot",
+        "telegrambot",
+        "whatsapp",
+        "linkedinbot",
+        "mastodon",
+        "skypeuripreview",
+        "redditbot",
+        "embedly",
+    ]
     
     @staticmethod
     def get_default_width():
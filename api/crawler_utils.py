@@ -0,0 +1,52 @@
+import re
+from html import escape
+from typing import Union
+
+
+class CrawlerUtils:
+    def __init__(self):
+        pass
+
+    @staticmethod
+    def compile_user_agent_pattern(user_agents: list[str]) -> Union[re.Pattern, None]:
+        user_agents = [user_agent.strip() for user_agent in user_agents if user_agent.strip()]
+
+        if not user_agents:
+            return None
+
+        return re.compile("|".join(re.escape(user_agent) for user_agent in user_agents), re.IGNORECASE)
+
+    @staticmethod
+    def is_crawler(user_agent: Union[str, None], pattern: Union[re.Pattern, None]) -> bool:
+        if not user_agent or not pattern:
+            return False
+
+        return pattern.search(user_agent) is not None
+
+    @staticmethod
+    def render_opengraph_page(*, title: str, url: str, og_title: str, site_name: str, image_url: str) -> str:
+        """
+        Renders a minimal page containing only the html header with the Open Graph tags,
+        mirroring the tags set by the full page template.
+
+        Returns:
+            str: the rendered page
+        """
+        title, url, og_title, site_name, image_url = (
+            escape(value) for value in (title, url, og_title, site_name, image_url)
+        )
+
+        return (
+            '<html lang="en"><head>'
+            + f"<title>{title}</title>"
+            + f'<meta property="og:url" content="{url}">'
+            + '<meta property="og:type" content="website">'
+            + f'<meta property="og:title" content="{og_title}">'
+            + f'<meta property="og:site_name" content="{site_name}">'
+            + f'<meta property="og:image" content="{image_url}">'
+            + '<meta name="twitter:card" content="summary_large_image">'
+            + f'<meta property="twitter:url" content="{url}">'
+            + f'<meta name="twitter:title" content="{og_title}">'
+            + f'<meta name="twitter:image" content="{image_url}">'
+            + "</head></html>"
+        )
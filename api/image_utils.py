@@ -2,13 +2,13 @@ import base64
 import hashlib
 from io import BytesIO
 import math
-import os
 from typing import Callable, Union
 from PIL import Image, ImageOps
 
 from .classes import ImageMetadata
 from .filename_utils import FilenameUtils
 from .constants import Constants
+from .storage import Storage
 
 MAX_SIZE = Constants.get_max_width()
 FORMAT = Constants.DEFAULT_FORMAT
@@ -64,6 +64,43 @@ class ImageUtils:
 
         return width, height
 
+    @staticmethod
+    def get_requested_dimensions(
+        *,
+        original_width: int,
+        original_height: int,
+        width: Union[int, None] = None,
+        height: Union[int, None] = None,
+        is_thumbnail: bool = False,
+    ) -> tuple[Union[int, None], Union[int, None]]:
+        """
+        Validates the requested dimensions of a variant against the allowed dimensions.
+
+        Raises:
+            ValueError: if neither the requested nor the calculated dimension is allowed, or if neither of both requested dimensions is allowed
+
+        Returns:
+            tuple[Union[int, None], Union[int, None]]: the width and height to request the variant with
+        """
+        if is_thumbnail:
+            width, height = Constants.get_small_thumbnail_width(), Constants.get_small_thumbnail_width()
+
+        if width and height and width not in Constants.ALLOWED_DIMENSIONS and height not in Constants.ALLOWED_DIMENSIONS:
+            raise ValueError("Width and height are not of allowed value!")
+
+        if not height and width and width not in Constants.ALLOWED_DIMENSIONS:
+            _, height = ImageUtils.calculate_scaled_size(original_width=original_width, original_height=original_height, width=width)
+            if not height in Constants.ALLOWED_DIMENSIONS:
+                raise ValueError("Width is not of allowed value!")
+
+        if not width and height and height not in Constants.ALLOWED_DIMENSIONS:
+            width, _ = ImageUtils.calculate_scaled_size(original_width=original_width, original_height=original_height, height=height)
+
+            if not width in Constants.ALLOWED_DIMENSIONS:
+                raise ValueError("Height is not of allowed value!")
+
+        return width, height
+
     @staticmethod
     def convert_to_unified_format_in_buffer(image: Image.Image) -> Image.Image:
         """
@@ -93,8 +130,8 @@ class ImageUtils:
         return new_image
 
     @staticmethod
-    def convert_to_unified_format_and_write_to_filesystem(
-        output_path: str, image: Image.Image, force_write: bool = False
+    def convert_to_unified_format_and_write_to_storage(
+        storage: Storage, image: Image.Image, force_write: bool = False
     ) -> tuple[str, ImageMetadata]:
         """
         Generates a new image from an input image with the following properties:
@@ -104,7 +141,7 @@ class ImageUtils:
         - no EXIF data from the input image
 
         Args:
-            output_path (str): the path to write the image to (filename will be appended)
+            storage (Storage): the storage to write the image to
             image (PIL.Image.Image): the image to convert
         """
 
@@ -116,18 +153,13 @@ class ImageUtils:
         if rgb_image.width > max_size or rgb_image.height > max_size:
             rgb_image = ImageUtils.resize(rgb_image, max_size, max_size, copy=False)
 
-        os.makedirs(output_path, exist_ok=True)
-
         id = ImageUtils.get_id(data=rgb_image)
-        filename = os.path.join(
-            output_path,
-            FilenameUtils.get_filename(
-                id=id, width=rgb_image.width, height=rgb_image.height, format=FORMAT
-            ),
+        filename = FilenameUtils.get_filename(
+            id=id, width=rgb_image.width, height=rgb_image.height, format=FORMAT
         )
 
-        if force_write or not os.path.isfile(filename):
-            rgb_image.save(filename, format=FORMAT)
+        if force_write or not storage.exists(filename):
+            storage.write_image(filename, rgb_image, format=FORMAT)
 
         metadata = ImageMetadata(
             original_width=rgb_image.width,
@@ -139,26 +171,26 @@ class ImageUtils:
         return (id, metadata)
 
     @staticmethod
-    def write_scaled_copy_from_source_filename_to_filesystem(
+    def write_scaled_copy_from_source_name_to_storage(
         *,
         id: str,
-        source_filename: str,
-        output_path: str,
+        source_name: str,
+        storage: Storage,
         width: Union[int, None] = None,
         height: Union[int, None] = None,
         crop: bool = False,
     ) -> str:
-        source = Image.open(source_filename)
-        return ImageUtils.write_scaled_copy_to_filesystem(
-            id=id, source=source, output_path=output_path, width=width, height=height, crop=crop
-        )
+        with storage.read_image(source_name) as source:
+            return ImageUtils.write_scaled_copy_to_storage(
+                id=id, source=source, storage=storage, width=width, height=height, crop=crop
+            )
 
     @staticmethod
-    def write_scaled_copy_to_filesystem(
+    def write_scaled_copy_to_storage(
         *,
         id: str,
         source: Image.Image,
-        output_path: str,
+        storage: Storage,
         width: Union[int, None] = None,
         height: Union[int, None] = None,
         crop: bool = False,
@@ -169,12 +201,31 @@ class ImageUtils:
         
         image = ImageUtils.resize(image, width, height, copy=False)
         image.format = source.format
-        filename = os.path.join(
-            output_path, FilenameUtils.get_filename(id=id, width=width, height=height, format=image.format)
-        )
-        image.save(filename)
+        filename = FilenameUtils.get_filename(id=id, width=width, height=height, format=image.format)
+        storage.write_image(filename, image, format=image.format)
         return filename
 
+    @staticmethod
+    def create_sprite(images: list[Image.Image], cell_size: int) -> Image.Image:
+        """
+        Concatenates multiple images horizontally into a single sprite. Every image is placed
+        in its own square cell, image n starts at x offset n * cell_size.
+
+        Args:
+            images (list[PIL.Image.Image]): the images to concatenate, in order
+            cell_size (int): the width and height of a single cell
+
+        Returns:
+            PIL.Image.Image: the sprite
+        """
+        sprite = Image.new("RGB", (cell_size * len(images), cell_size))
+
+        for index, image in enumerate(images):
+            sprite.paste(image, (index * cell_size, 0))
+
+        sprite.format = FORMAT
+        return sprite
+
     @staticmethod
     def get_id(*, data: Image.Image) -> str:
         pixel_bytes = data.tobytes()
@@ -1,6 +1,37 @@
-from pydantic import BaseModel
+from typing import Union
+from pydantic import BaseModel, Field
+
+from .constants import Constants
 
 
 class ImageResponse(BaseModel):
     id: str
     url: str
+
+
+class BatchImageRequestItem(BaseModel):
+    id: str
+    width: Union[int, None] = None
+    height: Union[int, None] = None
+    thumb: bool = False
+
+
+class BatchImageRequest(BaseModel):
+    items: list[BatchImageRequestItem] = Field(min_length=1, max_length=Constants.MAX_BATCH_SIZE)
+
+
+class BatchSpriteRequest(BaseModel):
+    ids: list[str] = Field(min_length=1, max_length=Constants.MAX_BATCH_SIZE)
+
+
+class BatchImageResponseItem(BaseModel):
+    id: str
+    url: Union[str, None] = None
+    width: Union[int, None] = None
+    height: Union[int, None] = None
+    media_type: Union[str, None] = None
+    error: Union[str, None] = None
+
+
+class BatchImageResponse(BaseModel):
+    items: list[BatchImageResponseItem]
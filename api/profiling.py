@@ -0,0 +1,219 @@
+import json
+import logging
+import logging.handlers
+import random
+from collections import deque
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from threading import Lock
+from time import perf_counter, time
+from typing import Union
+
+_current_profile: ContextVar[Union["RequestProfile", None]] = ContextVar("current_profile", default=None)
+
+
+@dataclass
+class StageTiming:
+    duration_ms: float = 0
+    count: int = 0
+
+
+@dataclass
+class RequestProfile:
+    method: str
+    path: str
+    started_at: float
+    duration_ms: float = 0
+    status_code: Union[int, None] = None
+    stages: dict[str, StageTiming] = field(default_factory=dict)
+    active_spans: list["_Span"] = field(default_factory=list, repr=False, compare=False)
+
+    def add(self, stage: str, duration_ms: float):
+        timing = self.stages.setdefault(stage, StageTiming())
+        timing.duration_ms += duration_ms
+        timing.count += 1
+
+    def to_dict(self) -> dict:
+        return {
+            "method": self.method,
+            "path": self.path,
+            "started_at": self.started_at,
+            "duration_ms": round(self.duration_ms, 3),
+            "status_code": self.status_code,
+            "stages": {
+                stage: {"duration_ms": round(timing.duration_ms, 3), "count": timing.count}
+                for stage, timing in self.stages.items()
+            },
+        }
+
+
+class _Span:
+    """
+    Records the exclusive time of a stage: the time spent in nested spans is attributed to the
+    nested stages only, so the stages of a request never overlap.
+    """
+
+    __slots__ = ("_profile", "_stage", "_start", "_child_ms")
+
+    def __init__(self, profile: RequestProfile, stage: str):
+        self._profile = profile
+        self._stage = stage
+        self._child_ms = 0
+
+    def __enter__(self):
+        self._profile.active_spans.append(self)
+        self._start = perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        duration_ms = (perf_counter() - self._start) * 1000
+        self._profile.active_spans.pop()
+        self._profile.add(self._stage, duration_ms - self._child_ms)
+
+        if self._profile.active_spans:
+            self._profile.active_spans[-1]._child_ms += duration_ms
+        return False
+
+
+class _NoopSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class ProfilingUtils:
+    LOOKUP = "lookup"
+    LOCK_WAIT = "lock_wait"
+    VARIANT_RESOLUTION = "variant_resolution"
+    GENERATION = "generation"
+    TEMPLATE_RENDER = "template_render"
+    RESPONSE_SEND = "response_send"
+
+    @staticmethod
+    def span(stage: str) -> Union[_Span, _NoopSpan]:
+        """
+        Times the wrapped block as part of the given stage of the current request.
+        Returns a shared no-op context manager if the current request isn't being profiled.
+
+        Args:
+            stage (str): the name of the stage
+
+        Returns:
+            Union[_Span, _NoopSpan]: the context manager to use
+        """
+        profile = _current_profile.get()
+        if profile is None:
+            return _NOOP_SPAN
+
+        return _Span(profile, stage)
+
+
+class Profiler:
+    _sample_rate: float
+    _slow_threshold_ms: Union[float, None]
+    _recent_profiles: deque
+    _mutex_lock: Lock
+    _file_logger: Union[logging.Logger, None] = None
+
+    def __init__(
+        self,
+        *,
+        sample_rate: float = 0,
+        slow_threshold_ms: Union[float, None] = None,
+        log_file: Union[str, None] = None,
+        max_recent_profiles: int = 1000,
+        max_log_file_bytes: int = 10 * 1024 * 1024,
+        log_file_backup_count: int = 3,
+    ):
+        self._sample_rate = sample_rate
+        self._slow_threshold_ms = slow_threshold_ms
+        self._recent_profiles = deque(maxlen=max_recent_profiles)
+        self._mutex_lock = Lock()
+
+        if log_file and self.is_enabled():
+            handler = logging.handlers.RotatingFileHandler(
+                log_file, maxBytes=max_log_file_bytes, backupCount=log_file_backup_count
+            )
+            handler.setFormatter(logging.Formatter("%(message)s"))
+
+            self._file_logger = logging.getLogger(f"{__name__}.profiles")
+            self._file_logger.handlers = [handler]
+            self._file_logger.setLevel(logging.INFO)
+            self._file_logger.propagate = False
+
+    def is_enabled(self) -> bool:
+        return self._sample_rate > 0 or self._slow_threshold_ms is not None
+
+    def should_profile(self) -> tuple[bool, bool]:
+        """
+        Returns:
+            tuple[bool, bool]: whether to profile the request at all and whether it has been sampled
+        """
+        sampled = self._sample_rate > 0 and random.random() < self._sample_rate
+        return sampled or self._slow_threshold_ms is not None, sampled
+
+    def finish(self, profile: RequestProfile, sampled: bool):
+        is_slow = self._slow_threshold_ms is not None and profile.duration_ms >= self._slow_threshold_ms
+        if not sampled and not is_slow:
+            return
+
+        with self._mutex_lock:
+            self._recent_profiles.append(profile)
+
+        if self._file_logger:
+            self._file_logger.info(json.dumps(profile.to_dict()))
+
+    def get_max_recent_profiles(self) -> int:
+        return self._recent_profiles.maxlen
+
+    def get_slowest(self, limit: int) -> list[RequestProfile]:
+        with self._mutex_lock:
+            profiles = list(self._recent_profiles)
+
+        return sorted(profiles, key=lambda profile: profile.duration_ms, reverse=True)[:limit]
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware recording a per-stage timing breakdown for sampled and slow requests.
+    """
+
+    def __init__(self, app, profiler: Profiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        should_profile, sampled = self.profiler.should_profile()
+        if not should_profile:
+            return await self.app(scope, receive, send)
+
+        profile = RequestProfile(method=scope["method"], path=scope["path"], started_at=time())
+        start = perf_counter()
+        send_start: Union[float, None] = None
+
+        async def send_wrapper(message):
+            nonlocal send_start
+            if message["type"] == "http.response.start":
+                profile.status_code = message["status"]
+                send_start = perf_counter()
+
+            await send(message)
+
+            if message["type"] == "http.response.body" and not message.get("more_body", False) and send_start:
+                profile.add(ProfilingUtils.RESPONSE_SEND, (perf_counter() - send_start) * 1000)
+
+        token = _current_profile.set(profile)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current_profile.reset(token)
+            profile.duration_ms = (perf_counter() - start) * 1000
+            self.profiler.finish(profile, sampled)
@@ -0,0 +1,303 @@
+import logging
+import os
+import shutil
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from io import BytesIO
+from queue import Queue
+from threading import Lock, get_ident
+from typing import Callable, Iterator, Union
+import inotify.adapters
+import inotify.constants
+from PIL import Image
+
+
+@dataclass
+class StorageEvent:
+    CREATED = "created"
+    DELETED = "deleted"
+
+    type: str
+    name: str
+
+
+class Storage(ABC):
+    """
+    A flat collection of named files, e.g. the source image directory or the cache directory.
+    Names are always relative to the storage root.
+    """
+
+    @abstractmethod
+    def list_names(self) -> list[str]:
+        pass
+
+    @abstractmethod
+    def exists(self, name: str) -> bool:
+        pass
+
+    def exists_many(self, names: list[str]) -> set[str]:
+        """
+        Checks the existence of multiple files at once.
+
+        Args:
+            names (list[str]): the names to check
+
+        Returns:
+            set[str]: the subset of names that exist
+        """
+        existing = set(self.list_names())
+        return {name for name in names if name in existing}
+
+    @abstractmethod
+    def read_bytes(self, name: str) -> bytes:
+        pass
+
+    @abstractmethod
+    def read_image(self, name: str) -> Image.Image:
+        pass
+
+    def write_image(self, name: str, image: Image.Image, format: Union[str, None] = None):
+        self.write_bytes(name, Storage.encode_image(name, image, format=format))
+
+    @abstractmethod
+    def write_bytes(self, name: str, data: bytes):
+        pass
+
+    @abstractmethod
+    def delete(self, name: str):
+        pass
+
+    def get_local_path(self, name: str) -> Union[str, None]:
+        """
+        Returns:
+            Union[str, None]: the path of the file on the local filesystem, None if the storage isn't backed by one
+        """
+        return None
+
+    @abstractmethod
+    def watch(self) -> Iterator[StorageEvent]:
+        """
+        Blocks and yields an event whenever a file has been written to or deleted from the storage.
+        """
+        pass
+
+    @staticmethod
+    def encode_image(name: str, image: Image.Image, format: Union[str, None] = None) -> bytes:
+        buf = BytesIO()
+        image.save(buf, format=format or image.format or os.path.splitext(name)[1].lstrip("."))
+        return buf.getvalue()
+
+
+class LocalStorage(Storage):
+    _directory: str
+
+    def __init__(self, directory: str):
+        self._directory = os.path.abspath(directory)
+        os.makedirs(self._directory, exist_ok=True)
+
+    def list_names(self) -> list[str]:
+        return [entry.name for entry in os.scandir(self._directory) if entry.is_file()]
+
+    def exists(self, name: str) -> bool:
+        return os.path.isfile(self.get_local_path(name))
+
+    def exists_many(self, names: list[str]) -> set[str]:
+        return {name for name in names if self.exists(name)}
+
+    def read_bytes(self, name: str) -> bytes:
+        with open(self.get_local_path(name), "rb") as f:
+            return f.read()
+
+    def read_image(self, name: str) -> Image.Image:
+        return Image.open(self.get_local_path(name))
+
+    def write_image(self, name: str, image: Image.Image, format: Union[str, None] = None):
+        format = format or image.format or os.path.splitext(name)[1].lstrip(".")
+        self._write_atomically(name, lambda path: image.save(path, format=format))
+
+    def write_bytes(self, name: str, data: bytes):
+        def write(path: str):
+            with open(path, "wb") as f:
+                f.write(data)
+
+        self._write_atomically(name, write)
+
+    def copy_from(self, name: str, source_path: str):
+        self._write_atomically(name, lambda path: shutil.copyfile(source_path, path))
+
+    def _write_atomically(self, name: str, write: Callable[[str], None]):
+        # write to a temporary file first so concurrent readers never see a partially written file
+        path = self.get_local_path(name)
+        temp_path = f"{path}.{os.getpid()}.{get_ident()}.tmp"
+        try:
+            write(temp_path)
+            os.replace(temp_path, path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def delete(self, name: str):
+        os.remove(self.get_local_path(name))
+
+    def get_local_path(self, name: str) -> str:
+        return os.path.join(self._directory, name)
+
+    def watch(self) -> Iterator[StorageEvent]:
+        i = inotify.adapters.Inotify()
+        i.add_watch(self._directory, mask=inotify.constants.IN_DELETE | inotify.constants.IN_CLOSE_WRITE)
+        logging.getLogger(__name__).info(f"Added watch for folder '{self._directory}'")
+
+        for event in i.event_gen(yield_nones=False):
+            (event_obj, _, _, filename) = event
+            mask = event_obj.mask
+
+            if (mask & inotify.constants.IN_CLOSE_WRITE) == inotify.constants.IN_CLOSE_WRITE:
+                yield StorageEvent(type=StorageEvent.CREATED, name=filename)
+            elif (mask & inotify.constants.IN_DELETE) == inotify.constants.IN_DELETE:
+                yield StorageEvent(type=StorageEvent.DELETED, name=filename)
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}('{self._directory}')"
+
+
+class MemoryStorage(Storage):
+    _files: dict[str, bytes]
+    _events: Queue
+    _mutex_lock: Lock
+
+    def __init__(self):
+        self._files = {}
+        self._events = Queue()
+        self._mutex_lock = Lock()
+
+    def list_names(self) -> list[str]:
+        with self._mutex_lock:
+            return list(self._files.keys())
+
+    def exists(self, name: str) -> bool:
+        return name in self._files
+
+    def exists_many(self, names: list[str]) -> set[str]:
+        with self._mutex_lock:
+            return {name for name in names if name in self._files}
+
+    def read_bytes(self, name: str) -> bytes:
+        data = self._files.get(name)
+        if data is None:
+            raise FileNotFoundError(f"No such file in memory storage: '{name}'")
+        return data
+
+    def read_image(self, name: str) -> Image.Image:
+        return Image.open(BytesIO(self.read_bytes(name)))
+
+    def write_bytes(self, name: str, data: bytes):
+        with self._mutex_lock:
+            self._files[name] = data
+        self._events.put(StorageEvent(type=StorageEvent.CREATED, name=name))
+
+    def delete(self, name: str):
+        with self._mutex_lock:
+            if name not in self._files:
+                raise FileNotFoundError(f"No such file in memory storage: '{name}'")
+            del self._files[name]
+        self._events.put(StorageEvent(type=StorageEvent.DELETED, name=name))
+
+    def watch(self) -> Iterator[StorageEvent]:
+        while True:
+            yield self._events.get()
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}()"
+
+
+class TieredStorage(Storage):
+    """
+    Combines a fast (hot) and a slow (cold) storage. Writes only go to the hot storage, unless
+    write-through is enabled. Files that are only present in the cold storage are promoted to the
+    hot storage on first access. The names present in the hot storage are tracked in memory, so
+    accessing a hot file doesn't touch the filesystem.
+    """
+
+    _hot: Storage
+    _cold: Storage
+    _write_through: bool
+    _hot_names: set[str]
+
+    def __init__(self, *, hot: Storage, cold: Storage, write_through: bool = False):
+        self._hot = hot
+        self._cold = cold
+        self._write_through = write_through
+        self._hot_names = set(hot.list_names())
+
+    def list_names(self) -> list[str]:
+        return list(set(self._hot.list_names()) | set(self._cold.list_names()))
+
+    def exists(self, name: str) -> bool:
+        return name in self._hot_names or self._cold.exists(name)
+
+    def exists_many(self, names: list[str]) -> set[str]:
+        existing = {name for name in names if name in self._hot_names}
+        return existing | self._cold.exists_many([name for name in names if name not in existing])
+
+    def read_bytes(self, name: str) -> bytes:
+        self._promote_if_missing(name)
+        try:
+            return self._hot.read_bytes(name)
+        except FileNotFoundError:
+            self._promote(name)
+            return self._hot.read_bytes(name)
+
+    def read_image(self, name: str) -> Image.Image:
+        self._promote_if_missing(name)
+        try:
+            return self._hot.read_image(name)
+        except FileNotFoundError:
+            self._promote(name)
+            return self._hot.read_image(name)
+
+    def write_bytes(self, name: str, data: bytes):
+        # images are encoded once by Storage.write_image and the same bytes are written to both tiers
+        self._hot.write_bytes(name, data)
+        self._hot_names.add(name)
+        if self._write_through:
+            self._cold.write_bytes(name, data)
+
+    def delete(self, name: str):
+        self._hot_names.discard(name)
+        deleted = False
+        for storage in (self._hot, self._cold):
+            if storage.exists(name):
+                storage.delete(name)
+                deleted = True
+
+        if not deleted:
+            raise FileNotFoundError(f"No such file in tiered storage: '{name}'")
+
+    def get_local_path(self, name: str) -> Union[str, None]:
+        self._promote_if_missing(name)
+        return self._hot.get_local_path(name)
+
+    def watch(self) -> Iterator[StorageEvent]:
+        return self._cold.watch()
+
+    def _promote_if_missing(self, name: str):
+        if name not in self._hot_names:
+            self._promote(name)
+
+    def _promote(self, name: str):
+        """
+        Copies a file from the cold to the hot storage. Also used to recover files that have
+        vanished from the hot storage since they've been tracked.
+        """
+        self._hot_names.discard(name)
+
+        cold_path = self._cold.get_local_path(name)
+        if isinstance(self._hot, LocalStorage) and cold_path:
+            self._hot.copy_from(name, cold_path)
+        else:
+            self._hot.write_bytes(name, self._cold.read_bytes(name))
+
+        self._hot_names.add(name)
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}(hot={self._hot!r}, cold={self._cold!r}, write_through={self._write_through})"
@@ -1,10 +1,12 @@
 from threading import Lock
 from time import sleep
 
+from .profiling import ProfilingUtils
+
 class ThreadingUtils:
     @staticmethod
     def wait_and_acquire_lock(lock: Lock):
-        while lock.locked():
-            sleep(0.001)
-        lock.acquire()
-        
\ No newline at end of file
+        with ProfilingUtils.span(ProfilingUtils.LOCK_WAIT):
+            while lock.locked():
+                sleep(0.001)
+            lock.acquire()
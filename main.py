@@ -1,25 +1,40 @@
 import logging
 import os
+import secrets
+from functools import lru_cache
 from typing import Union
-from fastapi import FastAPI, HTTPException, Request
-from fastapi.responses import FileResponse, HTMLResponse, RedirectResponse
+from fastapi import FastAPI, Header, HTTPException, Query, Request
+from io import BytesIO
+from fastapi.responses import FileResponse, HTMLResponse, RedirectResponse, Response
 from fastapi.staticfiles import StaticFiles
+from fastapi.datastructures import URL
 from fastapi.templating import Jinja2Templates
 from kaesebrot_commons.logging.utils import LoggingUtils
 
 from api.cache import Cache
-from api.classes import FaviconResponse, ResolutionVariant, TemplateResolutionMetadata
+from api.classes import FaviconResponse, ResolutionVariant, TemplateResolutionMetadata, VariantRequest
 from api.image_utils import ImageUtils
 from api.constants import Constants
+from api.crawler_utils import CrawlerUtils
+from api.profiling import Profiler, ProfilingMiddleware, ProfilingUtils
+from api.storage import LocalStorage, TieredStorage
+from api.models import BatchImageRequest, BatchImageResponse, BatchImageResponseItem, BatchSpriteRequest
 
 ENV_PREFIX = "RANDHAJ"
 
 version = os.getenv("APP_VERSION", "local-dev")
 source_image_dir = os.getenv(f"{ENV_PREFIX}_IMAGE_DIR", "assets/images")
 cache_dir = os.getenv(f"{ENV_PREFIX}_CACHE_DIR", "cache")
+hot_cache_dir = os.getenv(f"{ENV_PREFIX}_HOT_CACHE_DIR")
+hot_cache_write_through = os.getenv(f"{ENV_PREFIX}_HOT_CACHE_WRITE_THROUGH", "false").lower() == "true"
 site_title = os.getenv(f"{ENV_PREFIX}_SITE_TITLE", "Random image")
 site_emoji = os.getenv(f"{ENV_PREFIX}_SITE_EMOJI", "🦈")
 default_card_image_id = os.getenv(f"{ENV_PREFIX}_DEFAULT_CARD_IMAGE")
+crawler_user_agents = os.getenv(f"{ENV_PREFIX}_CRAWLER_USER_AGENTS")
+profiling_sample_rate = float(os.getenv(f"{ENV_PREFIX}_PROFILING_SAMPLE_RATE", 0))
+profiling_slow_threshold_ms = os.getenv(f"{ENV_PREFIX}_PROFILING_SLOW_THRESHOLD_MS")
+profiling_log_file = os.getenv(f"{ENV_PREFIX}_PROFILING_LOG_FILE", "profiling.log")
+profiling_debug_token = os.getenv(f"{ENV_PREFIX}_PROFILING_DEBUG_TOKEN")
 loglevel = os.getenv(f"{ENV_PREFIX}_LOG_LEVEL", os.getenv("UVICORN_LOG_LEVEL", logging.INFO))
 
 LoggingUtils.setup_logging_with_default_formatter(loglevel=loglevel)
@@ -33,33 +48,75 @@ app = FastAPI(title=site_title)
 app.mount("/static", StaticFiles(directory="resources/static"), name="static")
 templates = Jinja2Templates(directory="resources/templates")
 
-cache = Cache(image_dir=source_image_dir, cache_dir=cache_dir)
+profiler = Profiler(
+    sample_rate=profiling_sample_rate,
+    slow_threshold_ms=float(profiling_slow_threshold_ms) if profiling_slow_threshold_ms else None,
+    log_file=profiling_log_file,
+)
+
+if profiler.is_enabled():
+    app.add_middleware(ProfilingMiddleware, profiler=profiler)
+
+cache_storage = LocalStorage(cache_dir)
+
+if hot_cache_dir:
+    cache_storage = TieredStorage(hot=LocalStorage(hot_cache_dir), cold=cache_storage, write_through=hot_cache_write_through)
+
+cache = Cache(source_storage=LocalStorage(source_image_dir), cache_storage=cache_storage)
 
 if not default_card_image_id:
     default_card_image_id = cache.get_first_id()
 
+crawler_user_agent_pattern = CrawlerUtils.compile_user_agent_pattern(
+    Constants.DEFAULT_CRAWLER_USER_AGENTS if crawler_user_agents is None else crawler_user_agents.split(",")
+)
 
-def get_file_response(*, image_id: str, width: Union[int, None] = None, height: Union[int, None] = None, download: bool = False, set_cache_header: bool = True, is_thumbnail: bool = False) -> FileResponse:
-    if not cache.id_exists(image_id):
-        raise HTTPException(status_code=404, detail=f"File with id='{image_id}' could not be found!")
-    
-    metadata = cache.get_metadata(image_id)
+
+def is_crawler_request(request: Request) -> bool:
+    return CrawlerUtils.is_crawler(request.headers.get("user-agent"), crawler_user_agent_pattern)
+
+
+@lru_cache(maxsize=1024)
+def get_crawler_page_content(*, base_url: str, path: str, image_id: str, is_direct_request: bool) -> str:
+    # the query string is left out on purpose, crawlers tend to append tracking parameters
+    url = URL(base_url).replace(path=path)
+    card_image_id = image_id if is_direct_request else default_card_image_id
+    image_url = app.url_path_for("api_get_image", image_id=card_image_id).make_absolute_url(base_url).include_query_params(thumb=True)
     
-    if is_thumbnail:
-        width, height = Constants.get_small_thumbnail_width(), Constants.get_small_thumbnail_width()
+    return CrawlerUtils.render_opengraph_page(
+        title=f"{site_title} | {image_id}" if is_direct_request else site_title,
+        url=str(url),
+        og_title=image_id if is_direct_request else "A random image",
+        site_name=f"{site_emoji} {site_title}",
+        image_url=str(image_url),
+    )
+
+
+def get_crawler_page_response(request: Request, image_id: Union[str, None] = None, is_direct_request: bool = False) -> HTMLResponse:
+    with ProfilingUtils.span(ProfilingUtils.LOOKUP):
+        image_exists = not is_direct_request or cache.id_exists(image_id)
     
-    if not height and width and width not in Constants.ALLOWED_DIMENSIONS:
-        _, height = ImageUtils.calculate_scaled_size(original_width=metadata.original_width, original_height=metadata.original_height, width=width)
-        if not height in Constants.ALLOWED_DIMENSIONS:
-            raise HTTPException(status_code=400, detail=f"Width is not of allowed value!")
+    if not image_exists:
+        raise HTTPException(status_code=404, detail=f"Image with id='{image_id}' could not be found!")
     
-    if not width and height and height not in Constants.ALLOWED_DIMENSIONS:
-        width, _ = ImageUtils.calculate_scaled_size(original_width=metadata.original_width, original_height=metadata.original_height, height=height)
+    return HTMLResponse(
+        content=get_crawler_page_content(base_url=str(request.base_url), path=request.url.path, image_id=image_id, is_direct_request=is_direct_request)
+    )
+
+
+def get_file_response(*, image_id: str, width: Union[int, None] = None, height: Union[int, None] = None, download: bool = False, set_cache_header: bool = True, is_thumbnail: bool = False) -> Response:
+    with ProfilingUtils.span(ProfilingUtils.LOOKUP):
+        if not cache.id_exists(image_id):
+            raise HTTPException(status_code=404, detail=f"File with id='{image_id}' could not be found!")
         
-        if not width in Constants.ALLOWED_DIMENSIONS:
-            raise HTTPException(status_code=400, detail=f"Height is not of allowed value!")
+        metadata = cache.get_metadata(image_id)
+    
+    try:
+        width, height = ImageUtils.get_requested_dimensions(original_width=metadata.original_width, original_height=metadata.original_height, width=width, height=height, is_thumbnail=is_thumbnail)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
-    filename = cache.get_filename(
+    filename, stat_result = cache.get_variant_file(
         image_id, width=width, height=height, crop=is_thumbnail
     )
         
@@ -71,18 +128,28 @@ def get_file_response(*, image_id: str, width: Union[int, None] = None, height:
     if set_cache_header:
         headers["Cache-Control"] = "max-age=2592000, public, no-transform"
 
+    if not stat_result:
+        return Response(
+            content=cache.read_bytes(filename),
+            media_type=metadata.media_type,
+            headers=headers,
+        )
+
     return FileResponse(
-        path=filename,
+        path=cache.get_local_path(filename),
         media_type=metadata.media_type,
         headers=headers,
+        stat_result=stat_result,
     )
     
 def get_image_page_response(request: Request, image_id: str, is_direct_request: bool = False) -> HTMLResponse:
-    if not cache.id_exists(image_id):
-        raise HTTPException(status_code=404, detail=f"Image with id='{image_id}' could not be found!")
+    with ProfilingUtils.span(ProfilingUtils.LOOKUP):
+        if not cache.id_exists(image_id):
+            raise HTTPException(status_code=404, detail=f"Image with id='{image_id}' could not be found!")
+        
+        metadata = cache.get_metadata(image_id)
     
     current_width = Constants.get_default_width()
-    metadata = cache.get_metadata(image_id)
     current_width, current_height = ImageUtils.calculate_scaled_size(original_width=metadata.original_width, original_height=metadata.original_height, width=current_width)
     filename = cache.get_filename(image_id, width=current_width, height=current_height)
     filename = os.path.basename(filename)
@@ -100,11 +167,12 @@ def get_image_page_response(request: Request, image_id: str, is_direct_request:
     
     resolution_data = TemplateResolutionMetadata(current_width=current_width, current_height=current_height, variant_ladder=variants)
     
-    return templates.TemplateResponse(
-        request=request,
-        name="image.html",
-        context={"site_emoji": site_emoji, "site_title": site_title, "image_id": image_id, "image_filename": filename, "version": version, "resolution_data": resolution_data, "is_direct_request": is_direct_request, "default_card_image_id": default_card_image_id},
-    )
+    with ProfilingUtils.span(ProfilingUtils.TEMPLATE_RENDER):
+        return templates.TemplateResponse(
+            request=request,
+            name="image.html",
+            context={"site_emoji": site_emoji, "site_title": site_title, "image_id": image_id, "image_filename": filename, "version": version, "resolution_data": resolution_data, "is_direct_request": is_direct_request, "default_card_image_id": default_card_image_id},
+        )
 
 
 @app.get("/favicon.ico", response_class=FaviconResponse)
@@ -118,6 +186,9 @@ async def get_favicon():
 
 @app.get("/", response_class=Union[HTMLResponse, RedirectResponse])
 async def page_redirect_rand_image(request: Request, redirect: bool = False):
+    if not redirect and is_crawler_request(request):
+        return get_crawler_page_response(request)
+    
     image_id = cache.get_random_id()
 
     if redirect:
@@ -127,7 +198,10 @@ async def page_redirect_rand_image(request: Request, redirect: bool = False):
 
 
 @app.get("/{image_id}", response_class=HTMLResponse)
-async def page_get_image(request: Request, image_id: str):    
+async def page_get_image(request: Request, image_id: str):
+    if is_crawler_request(request):
+        return get_crawler_page_response(request, image_id, is_direct_request=True)
+    
     return get_image_page_response(request, image_id, is_direct_request=True)
 
 
@@ -153,3 +227,75 @@ async def api_get_rand_image(
 ):
     image_id = cache.get_random_id()
     return get_file_response(image_id=image_id, width=width, height=height, download=download, set_cache_header=False)
+
+
+@app.post("/api/img/batch", response_model=BatchImageResponse)
+def api_get_image_batch(request: Request, batch: BatchImageRequest):
+    variants = cache.get_variants(
+        [VariantRequest(id=item.id, width=item.width, height=item.height, thumb=item.thumb) for item in batch.items]
+    )
+    
+    response_items: list[BatchImageResponseItem] = []
+    
+    for item, variant in zip(batch.items, variants):
+        if variant.error:
+            response_items.append(BatchImageResponseItem(id=item.id, error=variant.error))
+            continue
+        
+        query_params = {"thumb": True} if item.thumb else {key: value for key, value in (("width", item.width), ("height", item.height)) if value}
+        response_items.append(BatchImageResponseItem(
+            id=item.id,
+            url=str(request.url_for("api_get_image", image_id=item.id).include_query_params(**query_params)),
+            width=variant.width,
+            height=variant.height,
+            media_type=variant.metadata.media_type,
+        ))
+    
+    return BatchImageResponse(items=response_items)
+
+
+@app.post("/api/img/batch/sprite")
+def api_get_image_batch_sprite(batch: BatchSpriteRequest):
+    thumbnail_width = Constants.get_small_thumbnail_width()
+    variants = cache.get_variants([VariantRequest(id=id, thumb=True) for id in batch.ids])
+    
+    for variant in variants:
+        if variant.error and not variant.metadata:
+            raise HTTPException(status_code=404, detail=variant.error)
+        if variant.error:
+            raise HTTPException(status_code=500, detail=variant.error)
+    
+    images = [cache.read_image(variant.filename) for variant in variants]
+    try:
+        sprite = ImageUtils.create_sprite(images, thumbnail_width)
+    finally:
+        for image in images:
+            image.close()
+    
+    buf = BytesIO()
+    sprite.save(buf, format=Constants.DEFAULT_FORMAT)
+    
+    headers = {
+        "Content-Disposition": "inline",
+        "X-Image-Ids": ",".join(variant.id for variant in variants),
+        "X-Sprite-Cell-Size": f"{thumbnail_width}",
+    }
+
+    return Response(
+        content=buf.getvalue(),
+        media_type=variants[0].metadata.media_type,
+        headers=headers,
+    )
+
+
+if profiler.is_enabled() and profiling_debug_token:
+    @app.get("/api/debug/profiles")
+    async def api_get_slowest_profiles(
+        limit: int = Query(default=20, ge=1, le=profiler.get_max_recent_profiles()),
+        authorization: Union[str, None] = Header(default=None),
+    ):
+        # compare bytes, compare_digest rejects strings containing non-ASCII characters
+        if not authorization or not secrets.compare_digest(authorization.encode(), f"Bearer {profiling_debug_token}".encode()):
+            raise HTTPException(status_code=401, detail="Invalid or missing debug token!")
+        
+        return [profile.to_dict() for profile in profiler.get_slowest(limit)]
@@ -0,0 +1,81 @@
+import pytest
+from PIL import Image
+from api.cache import Cache
+from api.classes import VariantRequest
+from api.storage import MemoryStorage
+
+
+class CountingMemoryStorage(MemoryStorage):
+    def __init__(self):
+        super().__init__()
+        self.written_names = []
+
+    def write_bytes(self, name: str, data: bytes):
+        self.written_names.append(name)
+        super().write_bytes(name, data)
+
+
+@pytest.fixture
+def storages():
+    source_storage, cache_storage = MemoryStorage(), CountingMemoryStorage()
+    source_storage.write_image("a.png", Image.new("RGB", (1024, 768), "red"), format="png")
+    return source_storage, cache_storage
+
+
+def test_variants_should_be_generated_once_and_report_errors(storages):
+    source_storage, cache_storage = storages
+    cache = Cache(source_storage=source_storage, cache_storage=cache_storage, enable_inotify=False)
+    id = cache._original_filenames_to_ids["a.png"]
+    cache_storage.written_names.clear()
+
+    variants = cache.get_variants([
+        VariantRequest(id=id, width=512),
+        VariantRequest(id=id, width=512),
+        VariantRequest(id="unknown", width=512),
+        VariantRequest(id=id, width=77),
+        VariantRequest(id=id, width=1000, height=1000),
+    ])
+
+    assert cache_storage.written_names == [f"{id}_512x384.png"]
+    assert variants[0] == variants[1]
+    assert (variants[0].width, variants[0].height, variants[0].error) == (512, 384, None)
+    assert "could not be found" in variants[2].error
+    assert "not of allowed value" in variants[3].error
+    assert "not of allowed value" in variants[4].error
+
+
+def test_failed_generation_should_only_fail_affected_variants(storages):
+    source_storage, cache_storage = storages
+    source_storage.write_image("b.png", Image.new("RGB", (1024, 768), "blue"), format="png")
+    cache = Cache(source_storage=source_storage, cache_storage=cache_storage, enable_inotify=False)
+    broken_id, working_id = cache._original_filenames_to_ids["a.png"], cache._original_filenames_to_ids["b.png"]
+    cache_storage.delete(f"{broken_id}_1024x768.png")
+
+    broken, working = cache.get_variants([VariantRequest(id=broken_id, width=256), VariantRequest(id=working_id, width=256)])
+
+    assert broken.error
+    assert working.error is None
+
+
+def test_vanished_variant_should_be_generated_again(storages):
+    source_storage, cache_storage = storages
+    cache = Cache(source_storage=source_storage, cache_storage=cache_storage, enable_inotify=False)
+    id = cache._original_filenames_to_ids["a.png"]
+
+    filename, _ = cache.get_variant_file(id, width=512)
+    cache_storage.delete(filename)
+
+    assert cache.get_variant_file(id, width=512) == (filename, None)
+    assert cache_storage.exists(filename)
+
+
+def test_cache_instances_should_not_share_state(storages):
+    source_storage, cache_storage = storages
+    first = Cache(source_storage=source_storage, cache_storage=cache_storage, enable_inotify=False)
+
+    other_source_storage = MemoryStorage()
+    other_source_storage.write_image("c.png", Image.new("RGB", (64, 64), "green"), format="png")
+    second = Cache(source_storage=other_source_storage, cache_storage=MemoryStorage(), enable_inotify=False)
+
+    assert not second.id_exists(first._original_filenames_to_ids["a.png"])
+    assert list(second._original_filenames_to_ids.keys()) == ["c.png"]
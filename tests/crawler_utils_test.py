@@ -0,0 +1,33 @@
+import pytest
+from api.constants import Constants
+from api.crawler_utils import CrawlerUtils
+
+
+def test_known_crawler_user_agent_should_be_detected():
+    pattern = CrawlerUtils.compile_user_agent_pattern(Constants.DEFAULT_CRAWLER_USER_AGENTS)
+
+    assert CrawlerUtils.is_crawler("Mozilla/5.0 (compatible; Discordbot/2.0; +https://discordapp.com)", pattern)
+    assert CrawlerUtils.is_crawler("facebookexternalhit/1.1", pattern)
+
+
+def test_browser_user_agent_should_not_be_detected():
+    pattern = CrawlerUtils.compile_user_agent_pattern(Constants.DEFAULT_CRAWLER_USER_AGENTS)
+
+    assert not CrawlerUtils.is_crawler("Mozilla/5.0 (X11; Linux x86_64; rv:131.0) Gecko/20100101 Firefox/131.0", pattern)
+    assert not CrawlerUtils.is_crawler(None, pattern)
+
+
+def test_empty_user_agent_list_should_disable_detection():
+    pattern = CrawlerUtils.compile_user_agent_pattern("".split(","))
+
+    assert pattern is None
+    assert not CrawlerUtils.is_crawler("Twitterbot/1.0", pattern)
+
+
+def test_opengraph_page_should_escape_values():
+    page = CrawlerUtils.render_opengraph_page(
+        title="a", url="https://example.com/?a=1&b=2", og_title='"quoted"', site_name="b", image_url="c"
+    )
+
+    assert 'content="https://example.com/?a=1&amp;b=2"' in page
+    assert 'content="&quot;quoted&quot;"' in page
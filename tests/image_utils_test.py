@@ -1,4 +1,5 @@
 import pytest
+from PIL import Image
 from api.image_utils import ImageUtils
 
 
@@ -48,3 +49,37 @@ def test_image_dimensions_should_be_scaled_correctly_with_smaller_height():
     )
     assert height == new_height
     assert width == expected_width
+
+
+def test_sprite_should_place_images_in_square_cells():
+    cell_size = 16
+    images = [Image.new("RGB", (cell_size, cell_size), color) for color in ["red", "blue", "green"]]
+
+    sprite = ImageUtils.create_sprite(images, cell_size)
+
+    assert sprite.size == (cell_size * 3, cell_size)
+    assert sprite.getpixel((0, 0)) == (255, 0, 0)
+    assert sprite.getpixel((cell_size, 0)) == (0, 0, 255)
+    assert sprite.getpixel((cell_size * 2, 0)) == (0, 128, 0)
+
+
+def test_requested_dimensions_should_reject_disallowed_width():
+    with pytest.raises(ValueError):
+        ImageUtils.get_requested_dimensions(original_width=2048, original_height=1536, width=77)
+
+
+def test_requested_dimensions_should_use_thumbnail_size():
+    width, height = ImageUtils.get_requested_dimensions(
+        original_width=2048, original_height=1536, width=512, is_thumbnail=True
+    )
+    assert width == height == 256
+
+
+def test_requested_dimensions_should_reject_disallowed_width_and_height():
+    with pytest.raises(ValueError):
+        ImageUtils.get_requested_dimensions(original_width=2048, original_height=1536, width=1000, height=1000)
+
+
+def test_requested_dimensions_should_accept_one_allowed_dimension():
+    width, height = ImageUtils.get_requested_dimensions(original_width=2048, original_height=1536, width=1024, height=1000)
+    assert (width, height) == (1024, 1000)
@@ -0,0 +1,53 @@
+import pytest
+from time import sleep
+from api.profiling import Profiler, ProfilingUtils, RequestProfile, _current_profile
+
+
+def test_span_without_active_profile_should_be_noop():
+    with ProfilingUtils.span(ProfilingUtils.LOOKUP) as first, ProfilingUtils.span(ProfilingUtils.LOOKUP) as second:
+        assert first is second
+
+
+def test_span_should_record_stage_on_active_profile():
+    profile = RequestProfile(method="GET", path="/", started_at=0)
+    token = _current_profile.set(profile)
+    try:
+        with ProfilingUtils.span(ProfilingUtils.LOOKUP):
+            pass
+        with ProfilingUtils.span(ProfilingUtils.LOOKUP):
+            pass
+    finally:
+        _current_profile.reset(token)
+
+    assert profile.stages[ProfilingUtils.LOOKUP].count == 2
+
+
+def test_profiler_should_only_keep_slow_requests_if_not_sampled():
+    profiler = Profiler(slow_threshold_ms=100)
+
+    profiler.finish(RequestProfile(method="GET", path="/fast", started_at=0, duration_ms=10), sampled=False)
+    profiler.finish(RequestProfile(method="GET", path="/slow", started_at=0, duration_ms=200), sampled=False)
+    profiler.finish(RequestProfile(method="GET", path="/slower", started_at=0, duration_ms=300), sampled=False)
+
+    assert [profile.path for profile in profiler.get_slowest(5)] == ["/slower", "/slow"]
+
+
+def test_disabled_profiler_should_not_profile():
+    profiler = Profiler()
+
+    assert not profiler.is_enabled()
+    assert profiler.should_profile() == (False, False)
+
+
+def test_nested_span_time_should_not_count_towards_parent():
+    profile = RequestProfile(method="GET", path="/", started_at=0)
+    token = _current_profile.set(profile)
+    try:
+        with ProfilingUtils.span(ProfilingUtils.LOOKUP):
+            with ProfilingUtils.span(ProfilingUtils.LOCK_WAIT):
+                sleep(0.05)
+    finally:
+        _current_profile.reset(token)
+
+    assert profile.stages[ProfilingUtils.LOCK_WAIT].duration_ms >= 50
+    assert profile.stages[ProfilingUtils.LOOKUP].duration_ms < 25
@@ -0,0 +1,87 @@
+import os
+import pytest
+from PIL import Image
+from api.storage import LocalStorage, MemoryStorage, StorageEvent, TieredStorage
+
+
+def test_memory_storage_should_round_trip_images():
+    storage = MemoryStorage()
+    storage.write_image("a_4x2.png", Image.new("RGB", (4, 2), "red"), format="png")
+
+    assert storage.exists("a_4x2.png")
+    with storage.read_image("a_4x2.png") as image:
+        assert image.size == (4, 2)
+        assert image.getpixel((0, 0)) == (255, 0, 0)
+
+
+def test_memory_storage_should_emit_events():
+    storage = MemoryStorage()
+    storage.write_image("a_4x2.png", Image.new("RGB", (4, 2)), format="png")
+    storage.delete("a_4x2.png")
+
+    events = storage.watch()
+    assert next(events) == StorageEvent(type=StorageEvent.CREATED, name="a_4x2.png")
+    assert next(events) == StorageEvent(type=StorageEvent.DELETED, name="a_4x2.png")
+
+
+def test_exists_many_should_return_existing_subset(tmp_path):
+    for storage in (MemoryStorage(), LocalStorage(str(tmp_path))):
+        storage.write_image("a_1x1.png", Image.new("RGB", (1, 1)), format="png")
+
+        assert storage.exists_many(["a_1x1.png", "b_1x1.png"]) == {"a_1x1.png"}
+
+
+def test_tiered_storage_should_promote_cold_files_on_access(tmp_path):
+    hot, cold = LocalStorage(str(tmp_path / "hot")), LocalStorage(str(tmp_path / "cold"))
+    cold.write_image("a_1x1.png", Image.new("RGB", (1, 1)), format="png")
+    storage = TieredStorage(hot=hot, cold=cold)
+
+    assert storage.exists("a_1x1.png")
+    assert not hot.exists("a_1x1.png")
+
+    assert storage.get_local_path("a_1x1.png") == hot.get_local_path("a_1x1.png")
+    assert hot.exists("a_1x1.png")
+
+
+def test_tiered_storage_should_promote_from_non_local_cold_storage(tmp_path):
+    hot, cold = LocalStorage(str(tmp_path)), MemoryStorage()
+    cold.write_image("a_1x1.png", Image.new("RGB", (1, 1)), format="png")
+    storage = TieredStorage(hot=hot, cold=cold)
+
+    assert storage.read_bytes("a_1x1.png") == cold.read_bytes("a_1x1.png")
+    assert hot.exists("a_1x1.png")
+
+
+def test_tiered_storage_should_only_write_through_if_enabled():
+    for write_through in (False, True):
+        hot, cold = MemoryStorage(), MemoryStorage()
+        storage = TieredStorage(hot=hot, cold=cold, write_through=write_through)
+        storage.write_image("a_1x1.png", Image.new("RGB", (1, 1)), format="png")
+
+        assert hot.exists("a_1x1.png")
+        assert cold.exists("a_1x1.png") == write_through
+        if write_through:
+            assert hot.read_bytes("a_1x1.png") == cold.read_bytes("a_1x1.png")
+
+
+def test_tiered_storage_should_recover_files_removed_from_hot_storage(tmp_path):
+    hot, cold = LocalStorage(str(tmp_path / "hot")), LocalStorage(str(tmp_path / "cold"))
+    storage = TieredStorage(hot=hot, cold=cold, write_through=True)
+    storage.write_image("a_1x1.png", Image.new("RGB", (1, 1)), format="png")
+    hot.delete("a_1x1.png")
+
+    with storage.read_image("a_1x1.png") as image:
+        assert image.size == (1, 1)
+    assert hot.exists("a_1x1.png")
+
+
+def test_local_storage_should_not_leave_partial_files_on_failed_write(tmp_path):
+    storage = LocalStorage(str(tmp_path))
+
+    with pytest.raises(KeyError):
+        storage.write_image("a_1x1.png", Image.new("RGB", (1, 1)), format="not-a-format")
+
+    assert os.listdir(tmp_path) == []
+
+    storage.write_image("a_1x1.png", Image.new("RGB", (1, 1)), format="png")
+    assert os.listdir(tmp_path) == ["a_1x1.png"]